@@ -1,29 +1,355 @@
 # app.py
-from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify, make_response
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import heapq
+import math
+import struct
+import threading
+import time
 from functools import wraps
 from datetime import datetime, timedelta
 from sqlalchemy import func # Import func for database functions like count
 
 # Import models from the models directory
-from models.models import db, User, ParkingLot, ParkingSpot, ReservedSpot
+from models.models import db, User, ParkingLot, ParkingSpot, ReservedSpot, SpotStatusChange, LotLocation
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # Configuration for SQLite database
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(BASE_DIR, 'parking_app.db')
+# DATABASE_URL overrides the default database (the tests and benchmarks use their own)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(BASE_DIR, 'parking_app.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'a_very_secret_and_complex_key_for_your_app' # IMPORTANT: Change this!
 app.config['SESSION_PERMANENT'] = False # Sessions are not permanent
 app.config['SESSION_TYPE'] = 'filesystem' # Store sessions on the filesystem
+# Admission control for booking spots (per lot, per process); releases are never queued
+app.config['BOOKING_MAX_CONCURRENT_PER_LOT'] = 1 # SQLite has a single writer, so running more at once only adds lock contention
+app.config['BOOKING_QUEUE_TIMEOUT'] = 2.0 # Seconds a queued request may wait; requests expected to wait longer get a 429 at once
+app.config['BOOKING_MAX_QUEUED_PER_LOT'] = 1000 # Hard cap on waiting requests, whatever the expected wait
+app.config['LOT_FULL_CACHE_SECONDS'] = 5.0 # How long a lot found full is turned away without querying the database
+app.config['SPOT_CHANGE_LOG_RETENTION'] = 1000 # Spot changes kept per lot for delta requests; older versions get a 410
+app.config['NEAREST_MAX_KM'] = 25.0 # Search radius of /api/lots/nearest around lat/lon
+app.config['NEAREST_MIN_PIN_PREFIX'] = 3 # Leading pin code digits a lot must share to count as nearby (3 = same sorting district)
+app.config['SPILLOVER_MAX_LOTS'] = 5 # Nearby lots tried when a booking spills over from a full lot
+app.config['SPILLOVER_MAX_KM'] = 5.0 # Furthest a booking may spill over, for lots with coordinates
+app.config['SPILLOVER_MIN_PIN_PREFIX'] = 4 # Leading pin code digits shared with the full lot, for lots without coordinates
 
 # Initialize SQLAlchemy with the app
 db.init_app(app)
 
+# Media types offered by /api/lots/<id> through the Accept header (JSON stays the default)
+SPOT_BITMAP_MIMETYPE = 'application/vnd.parking.spot-bitmap'
+SPOT_DELTA_MIMETYPE = 'application/vnd.parking.spot-delta'
+
+def record_spot_change(lot_id, spot_number):
+    """
+    Log a spot status change so compact API clients can pick it up as a delta.
+    The entry is only added to the session; it commits with the caller's transaction.
+    """
+    db.session.add(SpotStatusChange(lot_id=lot_id, spot_number=spot_number))
+
+def prune_spot_changes(lot_id):
+    """
+    Trim a lot's change log to the newest SPOT_CHANGE_LOG_RETENTION entries.
+    Call once after recording a batch of changes; it runs in the caller's transaction.
+    """
+    oldest_kept = db.session.query(SpotStatusChange.id).filter_by(lot_id=lot_id).order_by(
+        SpotStatusChange.id.desc()
+    ).offset(app.config['SPOT_CHANGE_LOG_RETENTION'] - 1).limit(1).scalar()
+    if oldest_kept is not None:
+        SpotStatusChange.query.filter(
+            SpotStatusChange.lot_id == lot_id,
+            SpotStatusChange.id < oldest_kept
+        ).delete(synchronize_session=False)
+
+class LotAdmissionControl:
+    """
+    Per-lot gate in front of the booking route.
+    Lets a bounded number of requests per lot run at once and queues the rest in arrival order.
+    A request whose expected wait (queue length x observed service time) exceeds the timeout
+    is rejected straight away, so that a burst degrades to quick 429s for the requests that
+    could not be served in time instead of piling up on the SQLite write lock.
+    Also remembers lots recently found full.
+    """
+    SERVICE_TIME_SMOOTHING = 0.2 # Weight of the newest sample in the service time average
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gates = {} # lot_id -> {'running', 'waiting', 'condition'}
+        self._full_until = {} # lot_id -> time.monotonic() deadline
+        self._service_time = 0.0 # Moving average of seconds a slot is held, shared by all lots
+
+    def expected_wait(self, waiting, max_concurrent):
+        """Seconds a request joining a queue of the given length is expected to wait."""
+        return (waiting + 1) * self._service_time / max_concurrent
+
+    def acquire(self, lot_id, max_concurrent, max_queued, timeout):
+        """Take a slot for the lot, waiting up to timeout seconds. Returns False if rejected."""
+        with self._lock:
+            gate = self._gates.get(lot_id)
+            if gate is None:
+                gate = self._gates[lot_id] = {'running': 0, 'waiting': 0, 'condition': threading.Condition(self._lock)}
+            if gate['running'] < max_concurrent and gate['waiting'] == 0:
+                gate['running'] += 1
+                return True
+            if gate['waiting'] >= max_queued or self.expected_wait(gate['waiting'], max_concurrent) > timeout:
+                return False
+
+            gate['waiting'] += 1
+            deadline = time.monotonic() + timeout
+            try:
+                while gate['running'] >= max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    gate['condition'].wait(remaining)
+                gate['running'] += 1
+                return True
+            finally:
+                gate['waiting'] -= 1
+
+    def release(self, lot_id, service_time=None):
+        """Give back a slot; service_time is how long it was held, in seconds."""
+        with self._lock:
+            if service_time is not None:
+                if self._service_time:
+                    self._service_time += self.SERVICE_TIME_SMOOTHING * (service_time - self._service_time)
+                else:
+                    self._service_time = service_time
+            gate = self._gates[lot_id]
+            gate['running'] -= 1
+            if gate['waiting']:
+                gate['condition'].notify()
+            elif gate['running'] == 0:
+                # Idle gates are dropped so the table only holds lots in use
+                del self._gates[lot_id]
+
+    def mark_full(self, lot_id, seconds):
+        with self._lock:
+            self._full_until[lot_id] = time.monotonic() + seconds
+
+    def clear_full(self, lot_id):
+        with self._lock:
+            self._full_until.pop(lot_id, None)
+
+    def is_full(self, lot_id):
+        with self._lock:
+            full_until = self._full_until.get(lot_id)
+            if full_until is None:
+                return False
+            if full_until <= time.monotonic():
+                del self._full_until[lot_id]
+                return False
+            return True
+
+lot_admission = LotAdmissionControl()
+
+class LotLocationIndex:
+    """
+    In-memory location index over parking lots, built from the database on first use.
+    Pin codes go into a prefix tree (a longer shared prefix means a nearer lot) and lots with
+    coordinates into a grid of CELL_DEGREES-sized cells searched ring by ring.
+    Lookups yield (lot_id, distance_km) nearest first; distance_km is None for pin code matches.
+    The index is per process. The process that changes a lot calls refresh() (after a lot is added
+    or deleted, or its pin code or coordinates change); other processes notice the change through a
+    fingerprint of the indexed columns, compared at most every STALENESS_CHECK_SECONDS.
+    """
+    CELL_DEGREES = 0.1 # About 11 km of latitude
+    EARTH_RADIUS_KM = 6371.0
+    STALENESS_CHECK_SECONDS = 5.0 # How often a lookup compares the index against the database
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def refresh(self):
+        """Rebuild the index now; lookups keep using the previous snapshot until it is ready."""
+        snapshot = self._build()
+        with self._lock:
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        return snapshot
+
+    def _load(self):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                self._snapshot = snapshot = self._build()
+                self._checked_at = time.monotonic()
+                return snapshot
+            if time.monotonic() - self._checked_at < self.STALENESS_CHECK_SECONDS:
+                return snapshot
+            self._checked_at = time.monotonic() # Only one lookup per interval runs the check
+        if self._signature() != snapshot['signature']:
+            return self.refresh()
+        return snapshot
+
+    def _signature(self):
+        """Cheap fingerprint of the indexed lot columns, to spot changes made by other processes."""
+        lots = db.session.query(
+            func.count(ParkingLot.id), func.max(ParkingLot.id),
+            func.sum(ParkingLot.id * db.cast(ParkingLot.pin_code, db.Integer))
+        ).one()
+        locations = db.session.query(
+            func.count(LotLocation.lot_id),
+            func.sum(LotLocation.lot_id * LotLocation.latitude),
+            func.sum(LotLocation.lot_id * LotLocation.longitude)
+        ).one()
+        return tuple(lots) + tuple(locations)
+
+    def _build(self):
+        signature = self._signature()
+        trie = {'children': {}, 'lots': []}
+        grid = {}
+        coordinates = {}
+        rows = db.session.query(
+            ParkingLot.id, ParkingLot.pin_code, LotLocation.latitude, LotLocation.longitude
+        ).outerjoin(LotLocation, LotLocation.lot_id == ParkingLot.id).order_by(ParkingLot.id)
+        for lot_id, pin_code, latitude, longitude in rows:
+            node = trie
+            for digit in pin_code:
+                node = node['children'].setdefault(digit, {'children': {}, 'lots': []})
+            node['lots'].append(lot_id)
+            if latitude is not None:
+                coordinates[lot_id] = (latitude, longitude)
+                grid.setdefault(self._cell(latitude, longitude), []).append(lot_id)
+        bounds = (min(r for r, _ in grid), max(r for r, _ in grid),
+                  min(c for _, c in grid), max(c for _, c in grid)) if grid else None
+        return {'trie': trie, 'grid': grid, 'bounds': bounds, 'coordinates': coordinates, 'signature': signature}
+
+    @classmethod
+    def _cell(cls, latitude, longitude):
+        return (math.floor(latitude / cls.CELL_DEGREES), math.floor(longitude / cls.CELL_DEGREES))
+
+    @classmethod
+    def distance_km(cls, latitude1, longitude1, latitude2, longitude2):
+        """Great-circle (haversine) distance between two points."""
+        phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+        a = (math.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2)
+        return 2 * cls.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+    @staticmethod
+    def _subtree_lots(node):
+        yield from node['lots']
+        for digit in sorted(node['children']):
+            yield from LotLocationIndex._subtree_lots(node['children'][digit])
+
+    def near_pin_code(self, pin_code, min_shared_digits=0):
+        """
+        Lots ordered by how much of the pin code they share, then by digit closeness.
+        Lots sharing fewer than min_shared_digits leading digits are left out.
+        """
+        trie = self._load()['trie']
+        path = [trie]
+        for digit in pin_code:
+            child = path[-1]['children'].get(digit)
+            if child is None:
+                break
+            path.append(child)
+        if len(path) - 1 < min_shared_digits:
+            return
+
+        def by_closeness(digits, target):
+            return sorted(digits, key=lambda digit: abs(int(digit) - int(target)) if digit.isdigit() and target.isdigit() else 10)
+
+        depth = len(path) - 1
+        if depth < len(pin_code):
+            # The pin code's own branch is missing: take this node's branches nearest digit first
+            yield from ((lot_id, None) for lot_id in path[-1]['lots'])
+            for digit in by_closeness(path[-1]['children'], pin_code[depth]):
+                for lot_id in self._subtree_lots(path[-1]['children'][digit]):
+                    yield lot_id, None
+        else:
+            for lot_id in self._subtree_lots(path[-1]):
+                yield lot_id, None
+        # Walk back up, visiting the sibling branches at each level nearest digit first
+        for depth in range(len(path) - 2, min_shared_digits - 1, -1):
+            visited = pin_code[depth]
+            for digit in by_closeness([digit for digit in path[depth]['children'] if digit != visited], visited):
+                for lot_id in self._subtree_lots(path[depth]['children'][digit]):
+                    yield lot_id, None
+
+    def near_coordinates(self, latitude, longitude, max_km):
+        """
+        Lots with coordinates within max_km, ordered by distance, searching grid rings outwards.
+        Rings are clipped to the cells that hold lots, and stop once they lie beyond max_km.
+        """
+        snapshot = self._load()
+        grid, coordinates = snapshot['grid'], snapshot['coordinates']
+        if not grid:
+            return
+        row, column = self._cell(latitude, longitude)
+        min_row, max_row, min_column, max_column = snapshot['bounds']
+
+        # Rings needed to cover max_km; a degree of longitude shrinks towards the poles
+        cell_km = math.radians(self.CELL_DEGREES) * self.EARTH_RADIUS_KM
+        widest_latitude = min(abs(latitude) + math.degrees(max_km / self.EARTH_RADIUS_KM), 89.0)
+        rings_for_distance = math.ceil(max_km / (cell_km * math.cos(math.radians(widest_latitude))))
+        max_ring = min(rings_for_distance,
+                       max(abs(min_row - row), abs(max_row - row), abs(min_column - column), abs(max_column - column)))
+
+        heap = []
+        for ring in range(max_ring + 1):
+            for r in range(max(row - ring, min_row), min(row + ring, max_row) + 1):
+                if abs(r - row) == ring:
+                    columns = range(max(column - ring, min_column), min(column + ring, max_column) + 1)
+                else: # Only the edge of the ring is new
+                    columns = [c for c in (column - ring, column + ring) if min_column <= c <= max_column]
+                for c in columns:
+                    for lot_id in grid.get((r, c), ()):
+                        lot_latitude, lot_longitude = coordinates[lot_id]
+                        distance = self.distance_km(latitude, longitude, lot_latitude, lot_longitude)
+                        if distance <= max_km:
+                            heapq.heappush(heap, (distance, lot_id))
+            # Everything within this radius of the point lies inside the rings searched so far
+            covered_degrees = ring * self.CELL_DEGREES
+            covered_km = math.radians(covered_degrees) * self.EARTH_RADIUS_KM * math.cos(
+                math.radians(min(abs(latitude) + covered_degrees, 90.0)))
+            while heap and heap[0][0] <= covered_km:
+                distance, lot_id = heapq.heappop(heap)
+                yield lot_id, distance
+        while heap:
+            distance, lot_id = heapq.heappop(heap)
+            yield lot_id, distance
+
+    def near(self, pin_code=None, latitude=None, longitude=None, *, max_km, min_shared_digits=0, exclude_lot_id=None):
+        """
+        Lots nearest a point and/or pin code, each yielded once.
+        Lots within max_km of the point come first by distance. Pin code matches follow,
+        limited to lots without coordinates when a point is given (the others are known to be too far).
+        """
+        seen = {exclude_lot_id}
+        with_point = latitude is not None and longitude is not None
+        if with_point:
+            for lot_id, distance in self.near_coordinates(latitude, longitude, max_km):
+                if lot_id not in seen:
+                    seen.add(lot_id)
+                    yield lot_id, distance
+        if pin_code:
+            coordinates = self._load()['coordinates']
+            for lot_id, distance in self.near_pin_code(pin_code, min_shared_digits):
+                if lot_id not in seen and not (with_point and lot_id in coordinates):
+                    seen.add(lot_id)
+                    yield lot_id, distance
+
+    def near_lot(self, lot, max_km, min_shared_digits):
+        """Other lots near the given one."""
+        location = lot.location
+        return self.near(pin_code=lot.pin_code,
+                         latitude=location.latitude if location else None,
+                         longitude=location.longitude if location else None,
+                         max_km=max_km,
+                         min_shared_digits=min_shared_digits,
+                         exclude_lot_id=lot.id)
+
+lot_locations = LotLocationIndex()
+
 # --- Authentication Decorators ---
 def login_required(f):
     """
@@ -55,6 +381,86 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admission_controlled(get_lot_id, fail_fast_when_full=False):
+    """
+    Decorator to run a booking route through the per-lot admission control.
+    get_lot_id receives the route's arguments and returns the lot to gate on (or None to skip).
+    With fail_fast_when_full, lots recently found full are turned away before queueing
+    (unless the booking may spill over to a nearby lot).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            lot_id = get_lot_id(**kwargs)
+            if lot_id is None:
+                return f(*args, **kwargs)
+
+            if fail_fast_when_full and lot_admission.is_full(lot_id) and not request.args.get('spillover'):
+                flash('No available spots in this parking lot.', 'danger')
+                return redirect(url_for('user_dashboard'))
+
+            if not lot_admission.acquire(lot_id,
+                                         app.config['BOOKING_MAX_CONCURRENT_PER_LOT'],
+                                         app.config['BOOKING_MAX_QUEUED_PER_LOT'],
+                                         app.config['BOOKING_QUEUE_TIMEOUT']):
+                return 'Too many requests for this parking lot right now. Please try again in a moment.', 429, {'Retry-After': '1'}
+            started = time.monotonic()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                lot_admission.release(lot_id, time.monotonic() - started)
+        return decorated_function
+    return decorator
+
+def nearest_available_lots(candidates, limit):
+    """
+    Take (lot_id, distance_km) candidates nearest first, as yielded by LotLocationIndex,
+    and return up to limit (lot, available_spots, distance_km) tuples for lots with free spots.
+    Candidates are checked in growing batches, usually in a single query.
+    """
+    results = []
+    batch_size = max(limit * 4, 32)
+    while len(results) < limit:
+        batch = [candidate for _, candidate in zip(range(batch_size), candidates)]
+        if not batch:
+            break
+        available = db.session.query(
+            ParkingLot, func.count(ParkingSpot.id)
+        ).join(ParkingSpot).filter(
+            ParkingLot.id.in_([lot_id for lot_id, _ in batch]),
+            ParkingSpot.status == 'A'
+        ).group_by(ParkingLot.id).all()
+        by_lot_id = {lot.id: (lot, count) for lot, count in available}
+        for lot_id, distance in batch:
+            if lot_id in by_lot_id and len(results) < limit:
+                lot, count = by_lot_id[lot_id]
+                results.append((lot, count, distance))
+        batch_size *= 2
+    return results
+
+def claim_spot(lot_id):
+    """
+    Mark the lowest-numbered available spot of a lot as occupied and return it, or None if the lot is full.
+    The update only applies while the spot is still available, so concurrent bookings
+    (even from other processes) can never claim the same spot. Commits with the caller's transaction.
+    """
+    while True:
+        spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').order_by(ParkingSpot.spot_number).first()
+        if spot is None:
+            return None
+        if ParkingSpot.query.filter_by(id=spot.id, status='A').update({'status': 'O'}):
+            return spot
+
+def claim_nearest_spot(lot):
+    """Claim a spot in the lot nearest to the given (full) one, or return None if no nearby lot has room."""
+    nearby = lot_locations.near_lot(lot, app.config['SPILLOVER_MAX_KM'], app.config['SPILLOVER_MIN_PIN_PREFIX'])
+    candidates = ((lot_id, distance) for lot_id, distance in nearby if not lot_admission.is_full(lot_id))
+    for nearby_lot, _, _ in nearest_available_lots(candidates, app.config['SPILLOVER_MAX_LOTS']):
+        spot = claim_spot(nearby_lot.id)
+        if spot:
+            return spot
+    return None
+
 # --- Routes (Controllers) ---
 
 @app.route('/')
@@ -239,6 +645,8 @@ def add_parking_lot():
         address = request.form.get('address')
         pin_code = request.form.get('pin_code')
         maximum_number_of_spots = request.form.get('maximum_number_of_spots')
+        latitude = request.form.get('latitude', '').strip()
+        longitude = request.form.get('longitude', '').strip()
 
         # Enhanced backend validation
         if not prime_location_name or not prime_location_name.strip():
@@ -251,11 +659,17 @@ def add_parking_lot():
             flash('Pin code must be a 6-digit number.', 'danger')
             return render_template('add_parking_lot.html', **request.form)
 
+        if bool(latitude) != bool(longitude):
+            flash('Latitude and longitude must be given together.', 'danger')
+            return render_template('add_parking_lot.html', **request.form)
+
         try:
             price_per_hour = float(price_per_hour)
             maximum_number_of_spots = int(maximum_number_of_spots)
+            latitude = float(latitude) if latitude else None
+            longitude = float(longitude) if longitude else None
         except (ValueError, TypeError):
-            flash('Price and spots must be valid numbers.', 'danger')
+            flash('Price, spots and coordinates must be valid numbers.', 'danger')
             return render_template('add_parking_lot.html', **request.form)
 
         if price_per_hour <= 0:
@@ -264,6 +678,9 @@ def add_parking_lot():
         if maximum_number_of_spots <= 0:
             flash('Maximum number of spots must be at least 1.', 'danger')
             return render_template('add_parking_lot.html', **request.form)
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            flash('Latitude must be between -90 and 90 and longitude between -180 and 180.', 'danger')
+            return render_template('add_parking_lot.html', **request.form)
 
         try:
             new_lot = ParkingLot(
@@ -280,7 +697,10 @@ def add_parking_lot():
             for i in range(1, maximum_number_of_spots + 1):
                 new_spot = ParkingSpot(lot_id=new_lot.id, spot_number=i, status='A')
                 db.session.add(new_spot)
+            if latitude is not None:
+                db.session.add(LotLocation(lot_id=new_lot.id, latitude=latitude, longitude=longitude))
             db.session.commit()
+            lot_locations.refresh()
 
             flash(f'Parking Lot "{prime_location_name}" and {maximum_number_of_spots} spots added successfully!', 'success')
             return redirect(url_for('admin_dashboard'))
@@ -301,6 +721,8 @@ def edit_parking_lot(lot_id):
         new_address = request.form.get('address')
         new_pin_code = request.form.get('pin_code')
         new_maximum_number_of_spots = request.form.get('maximum_number_of_spots')
+        new_latitude = request.form.get('latitude', '').strip()
+        new_longitude = request.form.get('longitude', '').strip()
 
         # Enhanced backend validation
         if not new_prime_location_name or not new_prime_location_name.strip():
@@ -313,11 +735,17 @@ def edit_parking_lot(lot_id):
             flash('Pin code must be a 6-digit number.', 'danger')
             return render_template('edit_parking_lot.html', parking_lot=parking_lot)
 
+        if bool(new_latitude) != bool(new_longitude):
+            flash('Latitude and longitude must be given together.', 'danger')
+            return render_template('edit_parking_lot.html', parking_lot=parking_lot)
+
         try:
             new_price_per_hour = float(new_price_per_hour)
             new_maximum_number_of_spots = int(new_maximum_number_of_spots)
+            new_latitude = float(new_latitude) if new_latitude else None
+            new_longitude = float(new_longitude) if new_longitude else None
         except (ValueError, TypeError):
-            flash('Price and spots must be valid numbers.', 'danger')
+            flash('Price, spots and coordinates must be valid numbers.', 'danger')
             return render_template('edit_parking_lot.html', parking_lot=parking_lot)
 
         if new_price_per_hour <= 0:
@@ -326,6 +754,9 @@ def edit_parking_lot(lot_id):
         if new_maximum_number_of_spots <= 0:
             flash('Maximum number of spots must be at least 1.', 'danger')
             return render_template('edit_parking_lot.html', parking_lot=parking_lot)
+        if new_latitude is not None and not (-90 <= new_latitude <= 90 and -180 <= new_longitude <= 180):
+            flash('Latitude must be between -90 and 90 and longitude between -180 and 180.', 'danger')
+            return render_template('edit_parking_lot.html', parking_lot=parking_lot)
 
         try:
             # Check if decreasing spots would remove occupied spots
@@ -338,7 +769,17 @@ def edit_parking_lot(lot_id):
             parking_lot.prime_location_name = new_prime_location_name
             parking_lot.price_per_hour = new_price_per_hour
             parking_lot.address = new_address
+            old_location = (parking_lot.pin_code,
+                            parking_lot.location.latitude if parking_lot.location else None,
+                            parking_lot.location.longitude if parking_lot.location else None)
             parking_lot.pin_code = new_pin_code
+            if new_latitude is None:
+                parking_lot.location = None
+            elif parking_lot.location:
+                parking_lot.location.latitude = new_latitude
+                parking_lot.location.longitude = new_longitude
+            else:
+                parking_lot.location = LotLocation(latitude=new_latitude, longitude=new_longitude)
 
             # Handle spot changes
             if new_maximum_number_of_spots > parking_lot.maximum_number_of_spots:
@@ -346,6 +787,7 @@ def edit_parking_lot(lot_id):
                 for i in range(parking_lot.maximum_number_of_spots + 1, new_maximum_number_of_spots + 1):
                     new_spot = ParkingSpot(lot_id=parking_lot.id, spot_number=i, status='A')
                     db.session.add(new_spot)
+                    record_spot_change(parking_lot.id, i)
             elif new_maximum_number_of_spots < parking_lot.maximum_number_of_spots:
                 # Delete excess spots (only if not occupied)
                 spots_to_delete = ParkingSpot.query.filter(
@@ -355,9 +797,14 @@ def edit_parking_lot(lot_id):
                 ).all()
                 for spot in spots_to_delete:
                     db.session.delete(spot)
+                    record_spot_change(parking_lot.id, spot.spot_number)
+            prune_spot_changes(parking_lot.id)
 
             parking_lot.maximum_number_of_spots = new_maximum_number_of_spots
             db.session.commit()
+            lot_admission.clear_full(parking_lot.id)
+            if old_location != (new_pin_code, new_latitude, new_longitude):
+                lot_locations.refresh()
             flash(f'Parking Lot "{parking_lot.prime_location_name}" updated successfully!', 'success')
             return redirect(url_for('admin_dashboard'))
         except Exception as e:
@@ -377,8 +824,11 @@ def delete_parking_lot(lot_id):
         flash(f'Cannot delete parking lot "{parking_lot.prime_location_name}" because there are {occupied_spots_count} occupied spots.', 'danger')
     else:
         try:
+            # Bulk delete the change log rather than loading it through the ORM
+            SpotStatusChange.query.filter_by(lot_id=lot_id).delete(synchronize_session=False)
             db.session.delete(parking_lot)
             db.session.commit()
+            lot_locations.refresh()
             flash(f'Parking Lot "{parking_lot.prime_location_name}" and all its spots deleted successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -419,6 +869,7 @@ def user_dashboard():
 
 @app.route('/book_spot/<int:lot_id>')
 @login_required
+@admission_controlled(lambda lot_id: lot_id, fail_fast_when_full=True)
 def book_spot(lot_id):
     user_id = session['user_id']
     
@@ -428,14 +879,22 @@ def book_spot(lot_id):
         flash('You already have an active parking reservation. Please release it first.', 'warning')
         return redirect(url_for('user_dashboard'))
 
-    # Find the first available spot in the selected lot
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').order_by(ParkingSpot.spot_number).first()
-
-    if available_spot:
-        try:
-            # Mark spot as occupied
-            available_spot.status = 'O'
-            db.session.add(available_spot)
+    try:
+        # Claim the first available spot in the selected lot, or with ?spillover=1 the nearest lot with room
+        available_spot = claim_spot(lot_id)
+        requested_lot = None
+        if not available_spot:
+            full_lot = ParkingLot.query.get(lot_id)
+            if full_lot:
+                # Only remember lots that exist, so made-up ids cannot grow the table
+                lot_admission.mark_full(lot_id, app.config['LOT_FULL_CACHE_SECONDS'])
+                if request.args.get('spillover'):
+                    requested_lot = full_lot
+                    available_spot = claim_nearest_spot(requested_lot)
+
+        if available_spot:
+            record_spot_change(available_spot.lot_id, available_spot.spot_number)
+            prune_spot_changes(available_spot.lot_id)
 
             # Create a new reservation
             new_reservation = ReservedSpot(
@@ -446,14 +905,20 @@ def book_spot(lot_id):
             db.session.add(new_reservation)
             db.session.commit()
 
-            flash(f'Spot {available_spot.spot_number} in {available_spot.parking_lot.prime_location_name} booked successfully!', 'success')
+            if requested_lot:
+                flash(f'{requested_lot.prime_location_name} is full, so Spot {available_spot.spot_number} in {available_spot.parking_lot.prime_location_name} was booked instead.', 'success')
+            else:
+                flash(f'Spot {available_spot.spot_number} in {available_spot.parking_lot.prime_location_name} booked successfully!', 'success')
             return redirect(url_for('my_reservations'))
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error booking spot: {str(e)}', 'danger')
-    else:
-        flash('No available spots in this parking lot.', 'danger')
-    
+
+        if request.args.get('spillover'):
+            flash('No available spots in this parking lot or any nearby lot.', 'danger')
+        else:
+            flash('No available spots in this parking lot.', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error booking spot: {str(e)}', 'danger')
+
     return redirect(url_for('user_dashboard'))
 
 @app.route('/my_reservations')
@@ -496,6 +961,7 @@ def my_reservations():
                            user_chart_labels=chart_labels,
                            user_chart_data=chart_data)
 
+# Releases skip the booking admission control: they free capacity, so they must never queue behind bookings
 @app.route('/release_spot/<int:reservation_id>', methods=['POST'])
 @login_required
 def release_spot(reservation_id):
@@ -523,9 +989,13 @@ def release_spot(reservation_id):
         if parking_spot:
             parking_spot.status = 'A'
             db.session.add(parking_spot)
+            record_spot_change(parking_spot.lot_id, parking_spot.spot_number)
+            prune_spot_changes(parking_spot.lot_id)
         
         db.session.add(reservation)
         db.session.commit()
+        if parking_spot:
+            lot_admission.clear_full(parking_spot.lot_id)
 
         flash(f'Spot released! Total cost: ${reservation.parking_cost:.2f}', 'success')
     except Exception as e:
@@ -559,13 +1029,135 @@ def api_lots():
         })
     return jsonify({'parking_lots': lot_list})
 
+@app.route('/api/lots/nearest', methods=['GET'])
+def api_nearest_lots():
+    """
+    API endpoint to find the parking lots nearest a location that still have free spots.
+    Takes pin_code and/or lat & lon, plus an optional limit (default 5, at most 50).
+    Only lots within NEAREST_MAX_KM, or sharing NEAREST_MIN_PIN_PREFIX pin code digits, are returned.
+    Returns JSON with the lots nearest first.
+    """
+    pin_code = request.args.get('pin_code', '').strip()
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+
+    if pin_code and (len(pin_code) != 6 or not pin_code.isdigit()):
+        return jsonify({'error': 'Pin code must be a 6-digit number.'}), 400
+    if (latitude is None) != (longitude is None):
+        return jsonify({'error': 'lat and lon must be given together.'}), 400
+    if latitude is not None and not (math.isfinite(latitude) and math.isfinite(longitude)
+                                     and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'error': 'lat must be between -90 and 90 and lon between -180 and 180.'}), 400
+    if not pin_code and latitude is None:
+        return jsonify({'error': 'A pin_code or lat and lon are required.'}), 400
+
+    lot_list = []
+    candidates = lot_locations.near(pin_code=pin_code, latitude=latitude, longitude=longitude,
+                                    max_km=app.config['NEAREST_MAX_KM'],
+                                    min_shared_digits=app.config['NEAREST_MIN_PIN_PREFIX'])
+    for lot, available_spots, distance in nearest_available_lots(candidates, limit):
+        lot_details = {
+            'id': lot.id,
+            'prime_location_name': lot.prime_location_name,
+            'price_per_hour': lot.price_per_hour,
+            'address': lot.address,
+            'pin_code': lot.pin_code,
+            'available_spots': available_spots
+        }
+        if distance is not None:
+            lot_details['distance_km'] = round(distance, 2)
+        lot_list.append(lot_details)
+    return jsonify({'parking_lots': lot_list})
+
+def lot_status_version(lot_id):
+    """
+    Current status version of a lot: the id of the latest logged spot change, or 0 if none.
+    """
+    return db.session.query(func.max(SpotStatusChange.id)).filter_by(lot_id=lot_id).scalar() or 0
+
+def spot_bitmap_response(lot):
+    """
+    Packed occupancy bitmap for a lot, ordered by spot_number.
+    Spot n is bit (n - 1) % 8 of byte (n - 1) // 8 (least significant bit first);
+    a set bit means Occupied. Spot numbers that do not exist read as 0.
+    """
+    # Read the version before the spots: a change landing in between is then
+    # reported again by the next delta, rather than being missed.
+    version = lot_status_version(lot.id)
+    spot_count = db.session.query(func.max(ParkingSpot.spot_number)).filter_by(lot_id=lot.id).scalar() or 0
+    occupied_numbers = db.session.query(ParkingSpot.spot_number).filter_by(lot_id=lot.id, status='O')
+
+    bitmap = bytearray((spot_count + 7) // 8)
+    for (spot_number,) in occupied_numbers:
+        bitmap[(spot_number - 1) >> 3] |= 1 << ((spot_number - 1) & 7)
+
+    response = make_response(bytes(bitmap))
+    response.mimetype = SPOT_BITMAP_MIMETYPE
+    response.headers['X-Lot-Version'] = str(version)
+    response.headers['X-Spot-Count'] = str(spot_count)
+    response.vary.add('Accept')
+    return response
+
+def spot_delta_response(lot):
+    """
+    Spots of a lot that changed after the version given in ?since=<version>.
+    Each changed spot is a big-endian uint32: the low 31 bits hold the spot_number and
+    the top bit is set if the spot is now Occupied. Removed spots are sent as Available.
+    Versions older than the retained change log get a 410; the client should refetch the bitmap.
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'A non-negative "since" version is required for delta requests.'}), 400
+
+    # Once the log has been trimmed, changes right after an old version may be gone
+    retained, oldest_retained = db.session.query(
+        func.count(SpotStatusChange.id), func.min(SpotStatusChange.id)
+    ).filter_by(lot_id=lot.id).one()
+    if retained >= app.config['SPOT_CHANGE_LOG_RETENTION'] and since < oldest_retained:
+        return jsonify({'error': 'Version is too old for a delta; fetch the bitmap instead.'}), 410
+
+    # Version first, as in spot_bitmap_response
+    version = lot_status_version(lot.id)
+    spot_count = db.session.query(func.max(ParkingSpot.spot_number)).filter_by(lot_id=lot.id).scalar() or 0
+    changed_spots = db.session.query(
+        SpotStatusChange.spot_number,
+        ParkingSpot.status
+    ).outerjoin(ParkingSpot, db.and_(
+        ParkingSpot.lot_id == SpotStatusChange.lot_id,
+        ParkingSpot.spot_number == SpotStatusChange.spot_number
+    )).filter(
+        SpotStatusChange.lot_id == lot.id,
+        SpotStatusChange.id > since
+    ).distinct().all()
+
+    entries = [spot_number | (0x80000000 if status == 'O' else 0) for spot_number, status in changed_spots]
+
+    response = make_response(struct.pack(f'>{len(entries)}I', *entries))
+    response.mimetype = SPOT_DELTA_MIMETYPE
+    response.headers['X-Lot-Version'] = str(version)
+    response.headers['X-Spot-Count'] = str(spot_count)
+    response.vary.add('Accept')
+    return response
+
 @app.route('/api/lots/<int:lot_id>', methods=['GET'])
 def api_lot_details(lot_id):
     """
     API endpoint to get details of a single parking lot.
     Returns JSON with lot details and a list of all its spots.
+    Clients may instead ask for a packed status bitmap (Accept: application/vnd.parking.spot-bitmap)
+    or for the spots changed since a version (Accept: application/vnd.parking.spot-delta, ?since=<version>).
     """
     lot = ParkingLot.query.get_or_404(lot_id)
+
+    # JSON is listed first so that it wins for */* and missing Accept headers
+    mimetype = request.accept_mimetypes.best_match(['application/json', SPOT_BITMAP_MIMETYPE, SPOT_DELTA_MIMETYPE])
+    if mimetype == SPOT_BITMAP_MIMETYPE:
+        return spot_bitmap_response(lot)
+    if mimetype == SPOT_DELTA_MIMETYPE:
+        return spot_delta_response(lot)
+
+    version = lot_status_version(lot.id)
     spot_list = []
     for spot in lot.spots:
         spot_details = {
@@ -588,9 +1180,12 @@ def api_lot_details(lot_id):
         'address': lot.address,
         'pin_code': lot.pin_code,
         'total_spots': len(lot.spots),
+        'status_version': version,
         'parking_spots': spot_list
     }
-    return jsonify(lot_details)
+    response = jsonify(lot_details)
+    response.vary.add('Accept')
+    return response
 
 @app.route('/api/spots', methods=['GET'])
 def api_spots():
@@ -0,0 +1,90 @@
+# bench/bench_booking_burst.py
+"""
+Goodput and tail latency of book_spot when many users book one lot at the same moment.
+Runs a baseline of --users requests and a burst of 10x that, with and without admission control.
+Usage: python bench/bench_booking_burst.py [--spots 100] [--users 20]
+"""
+import argparse
+import threading
+import time
+
+from common import use_temp_database, percentile, log_in
+
+use_temp_database()
+import app as parking_app
+from app import app, db
+from models.models import User, ParkingLot, ParkingSpot, ReservedSpot
+from sqlalchemy import func
+
+def run(spots, users, admission):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        lot = ParkingLot(prime_location_name='Stadium', price_per_hour=10, address='1 Main Road',
+                         pin_code='560001', maximum_number_of_spots=spots)
+        db.session.add(lot)
+        db.session.commit()
+        lot_id = lot.id
+        db.session.add_all([ParkingSpot(lot_id=lot_id, spot_number=i) for i in range(1, spots + 1)])
+        db.session.add_all([User(username=f'driver{i}', password='x', role='user') for i in range(users)])
+        db.session.commit()
+        user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+
+    parking_app.lot_admission = parking_app.LotAdmissionControl()
+    saved_config = {key: app.config[key] for key in ('BOOKING_MAX_CONCURRENT_PER_LOT', 'BOOKING_MAX_QUEUED_PER_LOT')}
+    if not admission:
+        app.config['BOOKING_MAX_CONCURRENT_PER_LOT'] = app.config['BOOKING_MAX_QUEUED_PER_LOT'] = 10 ** 6
+
+    results = []
+    start_line = threading.Barrier(users)
+    def book(user_id):
+        client = app.test_client()
+        log_in(client, user_id)
+        start_line.wait()
+        start = time.perf_counter()
+        response = client.get(f'/book_spot/{lot_id}')
+        results.append((time.perf_counter() - start, response.status_code, response.headers.get('Location', '')))
+
+    threads = [threading.Thread(target=book, args=(user_id,)) for user_id in user_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    app.config.update(saved_config)
+
+    with app.app_context():
+        booked = db.session.query(func.count(func.distinct(ReservedSpot.spot_id))).scalar()
+        reservations = ReservedSpot.query.count()
+    # Latency is reported per outcome: a fast 429 says nothing about how long real bookings took
+    outcomes = {'booked': [], 'lot full': [], '429': [], '5xx': []}
+    for latency, status, location in results:
+        if status == 429:
+            outcome = '429'
+        elif status >= 500:
+            outcome = '5xx'
+        elif 'my_reservations' in location:
+            outcome = 'booked'
+        else:
+            outcome = 'lot full'
+        outcomes[outcome].append(latency * 1000)
+    print(f"  {'on ' if admission else 'off'} users={users:<5} spots booked={booked:<4} reservations={reservations:<4} "
+          f"goodput={booked / wall:6.1f} spots/s wall={wall:5.2f}s")
+    for outcome, latencies in outcomes.items():
+        if latencies:
+            print(f"      {outcome:<9} n={len(latencies):<4} p50={percentile(latencies, 0.5):6.0f}ms "
+                  f"p99={percentile(latencies, 0.99):6.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--users', type=int, default=20, help='Baseline concurrency; the burst is 10x')
+    args = parser.parse_args()
+    print(f'{args.spots}-spot lot, threaded test clients, admission control on/off')
+    for users in (args.users, args.users * 10):
+        for admission in (False, True):
+            run(args.spots, users, admission)
+
+if __name__ == '__main__':
+    main()
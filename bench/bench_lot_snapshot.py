@@ -0,0 +1,67 @@
+# bench/bench_lot_snapshot.py
+"""
+Payload size and encode time of /api/lots/<id> as JSON, packed bitmap and delta.
+Usage: python bench/bench_lot_snapshot.py [--spots 5000] [--occupied 0.5] [--changes 5] [--repeat 20]
+"""
+import argparse
+import random
+import time
+
+from common import use_temp_database, log_in
+
+use_temp_database()
+from app import app, db, SPOT_BITMAP_MIMETYPE, SPOT_DELTA_MIMETYPE
+from models.models import User, ParkingLot, ParkingSpot, ReservedSpot
+from datetime import datetime
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spots', type=int, default=5000)
+    parser.add_argument('--occupied', type=float, default=0.5, help='Fraction of spots occupied')
+    parser.add_argument('--changes', type=int, default=5, help='Bookings made after the snapshot, sent as a delta')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with app.app_context():
+        lot = ParkingLot(prime_location_name='Stadium', price_per_hour=10, address='1 Main Road',
+                         pin_code='560001', maximum_number_of_spots=args.spots)
+        db.session.add(lot)
+        db.session.commit()
+        lot_id = lot.id
+        occupied = set(random.sample(range(1, args.spots + 1), int(args.spots * args.occupied)))
+        db.session.execute(ParkingSpot.__table__.insert(), [
+            {'lot_id': lot_id, 'spot_number': i, 'status': 'O' if i in occupied else 'A'} for i in range(1, args.spots + 1)
+        ])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'driver{i}', 'password': 'x', 'role': 'user'} for i in range(len(occupied) + args.changes)
+        ])
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'user')]
+        spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(status='O')]
+        # Occupied spots carry an active reservation, as they would after real bookings
+        db.session.execute(ReservedSpot.__table__.insert(), [
+            {'spot_id': spot_id, 'user_id': user_id, 'parking_timestamp': datetime.utcnow()}
+            for spot_id, user_id in zip(spot_ids, user_ids)
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+    version = client.get(f'/api/lots/{lot_id}', headers={'Accept': SPOT_BITMAP_MIMETYPE}).headers['X-Lot-Version']
+    for user_id in user_ids[len(spot_ids):]:
+        log_in(client, user_id)
+        client.get(f'/book_spot/{lot_id}')
+
+    print(f'{args.spots} spots, {len(occupied)} occupied, {args.changes} changes in the delta, mean of {args.repeat} requests')
+    for name, url, mimetype in (
+        ('json', f'/api/lots/{lot_id}', 'application/json'),
+        ('bitmap', f'/api/lots/{lot_id}', SPOT_BITMAP_MIMETYPE),
+        ('delta', f'/api/lots/{lot_id}?since={version}', SPOT_DELTA_MIMETYPE),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.get(url, headers={'Accept': mimetype})
+        elapsed_ms = (time.perf_counter() - start) / args.repeat * 1000
+        print(f'  {name:<7}{len(response.data):>10,} bytes {elapsed_ms:>9.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# bench/bench_nearest_lots.py
+"""
+Latency of /api/lots/nearest and of spillover booking over a large number of lots.
+Lots get random pin codes and, for most of them, random coordinates across India; half are full.
+Usage: python bench/bench_nearest_lots.py [--lots 50000] [--spots 10] [--with-coordinates 0.7] [--queries 300]
+"""
+import argparse
+import random
+import time
+
+from common import use_temp_database, percentile, log_in
+
+use_temp_database()
+import app as parking_app
+from app import app, db
+from models.models import User, ParkingLot, ParkingSpot, LotLocation
+
+def random_point():
+    return random.uniform(8, 35), random.uniform(68, 97)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lots', type=int, default=50000)
+    parser.add_argument('--spots', type=int, default=10, help='Spots per lot')
+    parser.add_argument('--with-coordinates', type=float, default=0.7, help='Fraction of lots with lat/lon')
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with app.app_context():
+        db.session.execute(ParkingLot.__table__.insert(), [
+            {'id': i, 'prime_location_name': f'Lot {i}', 'price_per_hour': 10, 'address': '1 Main Road',
+             'pin_code': str(random.randint(110000, 859999)), 'maximum_number_of_spots': args.spots}
+            for i in range(1, args.lots + 1)
+        ])
+        located = [i for i in range(1, args.lots + 1) if random.random() < args.with_coordinates]
+        db.session.execute(LotLocation.__table__.insert(), [
+            dict(zip(('lot_id', 'latitude', 'longitude'), (i,) + random_point())) for i in located
+        ])
+        full = set(random.sample(range(1, args.lots + 1), args.lots // 2))
+        db.session.execute(ParkingSpot.__table__.insert(), [
+            {'lot_id': i, 'spot_number': j, 'status': 'O' if i in full else 'A'}
+            for i in range(1, args.lots + 1) for j in range(1, args.spots + 1)
+        ])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'driver{i}', 'password': 'x', 'role': 'user'} for i in range(args.queries)
+        ])
+        db.session.commit()
+        user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+
+        start = time.perf_counter()
+        parking_app.lot_locations.refresh()
+        print(f'{args.lots} lots, {len(located)} with coordinates, {len(full)} full')
+        print(f'  index build {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    client = app.test_client()
+    def measure(name, urls):
+        latencies, found = [], 0
+        for url in urls:
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += len(response.get_json()['parking_lots'])
+        print(f'  {name:<30} p50={percentile(latencies, 0.5):6.2f} ms p99={percentile(latencies, 0.99):6.2f} ms'
+              f'  ({found / len(urls):.1f} lots per answer)')
+
+    for limit in (5, 50):
+        measure(f'nearest by pin, limit {limit}',
+                [f'/api/lots/nearest?pin_code={random.randint(110000, 859999)}&limit={limit}' for _ in range(args.queries)])
+        measure(f'nearest by lat/lon, limit {limit}',
+                ['/api/lots/nearest?lat=%f&lon=%f&limit=%d' % (random_point() + (limit,)) for _ in range(args.queries)])
+
+    latencies, spilled = [], 0
+    full_lots = random.sample(sorted(full), min(args.queries, len(full)))
+    for user_id, lot_id in zip(user_ids, full_lots):
+        log_in(client, user_id)
+        start = time.perf_counter()
+        response = client.get(f'/book_spot/{lot_id}?spillover=1')
+        latencies.append((time.perf_counter() - start) * 1000)
+        spilled += 'my_reservations' in response.headers['Location']
+    print(f"  {'spillover booking, full lot':<30} p50={percentile(latencies, 0.5):6.2f} ms "
+          f'p99={percentile(latencies, 0.99):6.2f} ms  ({spilled}/{len(latencies)} found a nearby lot)')
+
+if __name__ == '__main__':
+    main()
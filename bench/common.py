@@ -0,0 +1,19 @@
+# bench/common.py
+"""Shared setup for the benchmark scripts: run them from the repository root, e.g. python bench/bench_lot_snapshot.py"""
+import os
+import sys
+import tempfile
+
+def use_temp_database():
+    """Point app.py at a throwaway SQLite file; call before importing app."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def log_in(client, user_id, role='user'):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['user_role'] = role
@@ -24,6 +24,8 @@ class ParkingLot(db.Model):
     # Relationship to ParkingSpot: 'spots' is a list of ParkingSpot objects associated with this lot
     # cascade="all, delete-orphan" means if a ParkingLot is deleted, its associated ParkingSpots are also deleted.
     spots = db.relationship('ParkingSpot', backref='parking_lot', lazy=True, cascade="all, delete-orphan")
+    # Optional coordinates used by the nearest-lot lookup
+    location = db.relationship('LotLocation', uselist=False, lazy=True, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'<ParkingLot {self.prime_location_name}>'
@@ -52,4 +54,25 @@ class ReservedSpot(db.Model):
     spot = db.relationship('ParkingSpot', backref='current_reservation', uselist=False) # One-to-one or one-to-many
 
     def __repr__(self):
-        return f'<ReservedSpot {self.id} by User {self.user_id} at Spot {self.spot_id}>'
\ No newline at end of file
+        return f'<ReservedSpot {self.id} by User {self.user_id} at Spot {self.spot_id}>'
+
+class SpotStatusChange(db.Model):
+    # Append-only log of spot status changes. The auto-incrementing id doubles as the
+    # status version: a lot's current version is the highest id logged for it.
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
+    spot_number = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_spot_status_change_lot_version', 'lot_id', 'id'),)
+
+    def __repr__(self):
+        return f'<SpotStatusChange {self.id}: Spot {self.spot_number} in Lot {self.lot_id}>'
+
+class LotLocation(db.Model):
+    # Optional latitude/longitude of a lot, kept apart from ParkingLot so existing databases need no migration
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<LotLocation {self.latitude}, {self.longitude} of Lot {self.lot_id}>'
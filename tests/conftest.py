@@ -0,0 +1,58 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before it is imported (app.py creates tables on import)
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as parking_app
+from models.models import db, User, ParkingLot, ParkingSpot
+
+
+@pytest.fixture
+def app(monkeypatch):
+    flask_app = parking_app.app
+    flask_app.config['TESTING'] = True
+    # Fresh per-process state for every test
+    monkeypatch.setattr(parking_app, 'lot_admission', parking_app.LotAdmissionControl())
+    monkeypatch.setattr(parking_app, 'lot_locations', parking_app.LotLocationIndex())
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_lot(name='Lot', pin_code='560001', spots=5, occupied=(), lot_id=None):
+    """Add a lot with spots numbered 1..spots; the given spot numbers start out occupied."""
+    lot = ParkingLot(id=lot_id, prime_location_name=name, price_per_hour=10.0, address='1 Main Road',
+                     pin_code=pin_code, maximum_number_of_spots=spots)
+    db.session.add(lot)
+    db.session.flush()
+    db.session.add_all([ParkingSpot(lot_id=lot.id, spot_number=i, status='O' if i in occupied else 'A')
+                        for i in range(1, spots + 1)])
+    db.session.commit()
+    return lot
+
+
+def make_user(name='driver'):
+    user = User(username=name, password='x', role='user')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def log_in(client, user):
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['user_role'] = user.role
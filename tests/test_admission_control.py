@@ -0,0 +1,151 @@
+# tests/test_admission_control.py
+import threading
+import time
+
+import app as parking_app
+from app import LotAdmissionControl
+from models.models import ReservedSpot
+from conftest import make_lot, make_user, log_in
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out waiting for condition'
+        time.sleep(0.001)
+
+
+def test_rejects_beyond_queue_limit():
+    gate = LotAdmissionControl()
+    assert gate.acquire(1, max_concurrent=1, max_queued=0, timeout=1)
+    assert not gate.acquire(1, max_concurrent=1, max_queued=0, timeout=1)
+    # Other lots have their own gate
+    assert gate.acquire(2, max_concurrent=1, max_queued=0, timeout=1)
+
+
+def test_queued_request_times_out():
+    gate = LotAdmissionControl()
+    assert gate.acquire(1, max_concurrent=1, max_queued=1, timeout=1)
+    start = time.monotonic()
+    assert not gate.acquire(1, max_concurrent=1, max_queued=1, timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+
+
+def test_rejects_when_expected_wait_exceeds_timeout():
+    gate = LotAdmissionControl()
+    assert gate.acquire(1, max_concurrent=1, max_queued=100, timeout=1)
+    gate.release(1, service_time=0.5)
+    assert gate.expected_wait(0, max_concurrent=1) == 0.5
+    assert gate.expected_wait(3, max_concurrent=2) == 1.0
+
+    assert gate.acquire(1, max_concurrent=1, max_queued=100, timeout=1)
+    start = time.monotonic()
+    # One slot held for ~0.5s: a 0.4s budget cannot be met, so no waiting at all
+    assert not gate.acquire(1, max_concurrent=1, max_queued=100, timeout=0.4)
+    assert time.monotonic() - start < 0.1
+
+
+def test_service_time_is_a_moving_average():
+    gate = LotAdmissionControl()
+    for service_time in (1.0, 2.0):
+        assert gate.acquire(1, max_concurrent=1, max_queued=0, timeout=1)
+        gate.release(1, service_time=service_time)
+    assert gate.expected_wait(0, max_concurrent=1) == 1.0 + LotAdmissionControl.SERVICE_TIME_SMOOTHING
+
+
+def test_slots_are_handed_over_in_arrival_order():
+    gate = LotAdmissionControl()
+    assert gate.acquire(1, max_concurrent=1, max_queued=10, timeout=5)
+    order = []
+
+    def waiter(name):
+        if gate.acquire(1, max_concurrent=1, max_queued=10, timeout=5):
+            order.append(name)
+            gate.release(1)
+
+    threads = []
+    for i, name in enumerate(('first', 'second', 'third')):
+        thread = threading.Thread(target=waiter, args=(name,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: gate._gates[1]['waiting'] == i + 1)
+
+    gate.release(1)
+    for thread in threads:
+        thread.join()
+    assert order == ['first', 'second', 'third']
+
+
+def test_idle_gates_are_dropped():
+    gate = LotAdmissionControl()
+    assert gate.acquire(1, max_concurrent=2, max_queued=0, timeout=1)
+    assert gate.acquire(1, max_concurrent=2, max_queued=0, timeout=1)
+    gate.release(1)
+    assert 1 in gate._gates
+    gate.release(1)
+    assert gate._gates == {}
+
+
+def test_full_mark_expires():
+    gate = LotAdmissionControl()
+    gate.mark_full(1, seconds=60)
+    gate.mark_full(2, seconds=0)
+    assert gate.is_full(1)
+    assert not gate.is_full(2)
+    assert 2 not in gate._full_until
+    gate.clear_full(1)
+    assert not gate.is_full(1)
+
+
+def test_booking_gets_429_when_lot_is_saturated(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'BOOKING_MAX_QUEUED_PER_LOT', 0)
+    lot = make_lot()
+    log_in(client, make_user())
+    assert parking_app.lot_admission.acquire(lot.id, 1, 0, 1)
+
+    response = client.get(f'/book_spot/{lot.id}')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert ReservedSpot.query.count() == 0
+
+
+def test_release_is_not_queued_behind_bookings(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'BOOKING_MAX_QUEUED_PER_LOT', 0)
+    lot = make_lot(spots=1)
+    user = make_user()
+    log_in(client, user)
+    client.get(f'/book_spot/{lot.id}')
+    reservation = ReservedSpot.query.filter_by(user_id=user.id).one()
+
+    # The lot's booking gate is busy and its queue is full
+    assert parking_app.lot_admission.acquire(lot.id, 1, 0, 1)
+    assert client.get(f'/book_spot/{lot.id}').status_code == 429
+
+    response = client.post(f'/release_spot/{reservation.id}')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/my_reservations')
+    assert ReservedSpot.query.filter_by(leaving_timestamp=None).count() == 0
+
+
+def test_full_lot_fails_fast_until_a_spot_is_released(client):
+    lot = make_lot(spots=1)
+    first, second = make_user('first'), make_user('second')
+    log_in(client, first)
+    client.get(f'/book_spot/{lot.id}')
+    log_in(client, second)
+    client.get(f'/book_spot/{lot.id}')
+    assert parking_app.lot_admission.is_full(lot.id)
+
+    log_in(client, first)
+    reservation = ReservedSpot.query.filter_by(user_id=first.id).one()
+    client.post(f'/release_spot/{reservation.id}')
+    assert not parking_app.lot_admission.is_full(lot.id)
+    assert parking_app.lot_admission._gates == {}
+
+
+def test_unknown_lot_is_not_remembered(client):
+    log_in(client, make_user())
+    response = client.get('/book_spot/987654')
+    assert response.status_code == 302
+    assert parking_app.lot_admission._full_until == {}
+    assert parking_app.lot_admission._gates == {}
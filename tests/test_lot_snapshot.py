@@ -0,0 +1,91 @@
+# tests/test_lot_snapshot.py
+import struct
+
+import app as parking_app
+from app import SPOT_BITMAP_MIMETYPE, SPOT_DELTA_MIMETYPE
+from models.models import db, User, ParkingSpot, SpotStatusChange
+from conftest import make_lot, make_user, log_in
+
+
+def decode_delta(data):
+    return sorted(struct.unpack(f'>{len(data) // 4}I', data))
+
+
+def test_bitmap_is_lsb_first_by_spot_number(client):
+    lot = make_lot(spots=10, occupied={1, 8, 9})
+    response = client.get(f'/api/lots/{lot.id}', headers={'Accept': SPOT_BITMAP_MIMETYPE})
+    assert response.mimetype == SPOT_BITMAP_MIMETYPE
+    assert response.data == bytes([0b10000001, 0b00000001])
+    assert response.headers['X-Spot-Count'] == '10'
+    assert response.headers['X-Lot-Version'] == '0'
+    assert 'Accept' in response.headers['Vary']
+
+
+def test_json_is_the_default(client):
+    lot = make_lot(spots=2)
+    for headers in ({}, {'Accept': '*/*'}, {'Accept': 'application/json'}, {'Accept': 'text/html'}):
+        response = client.get(f'/api/lots/{lot.id}', headers=headers)
+        assert response.mimetype == 'application/json'
+        assert response.get_json()['status_version'] == 0
+        assert len(response.get_json()['parking_spots']) == 2
+
+
+def test_delta_encodes_occupied_bit_and_removed_spots(client):
+    lot = make_lot(spots=3, occupied={2})
+    for spot_number in (2, 3, 7, 2): # Spot 7 no longer exists
+        db.session.add(SpotStatusChange(lot_id=lot.id, spot_number=spot_number))
+    db.session.commit()
+
+    response = client.get(f'/api/lots/{lot.id}?since=0', headers={'Accept': SPOT_DELTA_MIMETYPE})
+    assert response.status_code == 200
+    assert response.mimetype == SPOT_DELTA_MIMETYPE
+    assert decode_delta(response.data) == [3, 7, 0x80000002]
+    assert response.headers['X-Lot-Version'] == str(parking_app.lot_status_version(lot.id))
+
+
+def test_delta_only_returns_changes_after_version(client):
+    lot = make_lot(spots=3)
+    user = make_user()
+    log_in(client, user)
+    version = int(client.get(f'/api/lots/{lot.id}', headers={'Accept': SPOT_BITMAP_MIMETYPE}).headers['X-Lot-Version'])
+
+    client.get(f'/book_spot/{lot.id}')
+    response = client.get(f'/api/lots/{lot.id}?since={version}', headers={'Accept': SPOT_DELTA_MIMETYPE})
+    assert decode_delta(response.data) == [0x80000001]
+
+    new_version = int(response.headers['X-Lot-Version'])
+    response = client.get(f'/api/lots/{lot.id}?since={new_version}', headers={'Accept': SPOT_DELTA_MIMETYPE})
+    assert response.data == b''
+
+
+def test_delta_requires_since(client):
+    lot = make_lot()
+    for query in ('', '?since=-1', '?since=abc'):
+        response = client.get(f'/api/lots/{lot.id}{query}', headers={'Accept': SPOT_DELTA_MIMETYPE})
+        assert response.status_code == 400
+
+
+def test_delta_older_than_retained_log_is_gone(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'SPOT_CHANGE_LOG_RETENTION', 2)
+    lot = make_lot(spots=4)
+    for i in range(4):
+        log_in(client, make_user(f'driver{i}'))
+        client.get(f'/book_spot/{lot.id}')
+    assert SpotStatusChange.query.filter_by(lot_id=lot.id).count() == 2
+
+    oldest = db.session.query(db.func.min(SpotStatusChange.id)).scalar()
+    assert client.get(f'/api/lots/{lot.id}?since=0', headers={'Accept': SPOT_DELTA_MIMETYPE}).status_code == 410
+    response = client.get(f'/api/lots/{lot.id}?since={oldest}', headers={'Accept': SPOT_DELTA_MIMETYPE})
+    assert decode_delta(response.data) == [0x80000004]
+
+
+def test_deleting_lot_removes_change_log(client):
+    lot = make_lot(spots=2)
+    db.session.add(SpotStatusChange(lot_id=lot.id, spot_number=1))
+    db.session.add(User(username='boss', password='x', role='admin'))
+    db.session.commit()
+    log_in(client, User.query.filter_by(username='boss').first())
+
+    client.post(f'/delete_parking_lot/{lot.id}')
+    assert SpotStatusChange.query.count() == 0
+    assert ParkingSpot.query.count() == 0
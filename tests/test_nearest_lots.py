@@ -0,0 +1,228 @@
+# tests/test_nearest_lots.py
+from sqlalchemy import event
+
+import app as parking_app
+from app import LotLocationIndex, claim_spot
+from models.models import db, LotLocation, ParkingLot, ParkingSpot, ReservedSpot
+from conftest import make_lot, make_user, log_in
+
+
+def place(lot, latitude, longitude):
+    db.session.add(LotLocation(lot_id=lot.id, latitude=latitude, longitude=longitude))
+    db.session.commit()
+
+
+def lot_ids(results):
+    return [lot_id for lot_id, _ in results]
+
+
+def test_pin_codes_rank_by_shared_prefix_then_digit_closeness(app):
+    exact = make_lot('Exact', '560001')
+    same_five = make_lot('Next door', '560002')
+    far_digit = make_lot('Across town', '560090')
+    near_digit = make_lot('Nearby area', '560010')
+    other_city = make_lot('Delhi', '110001')
+
+    index = LotLocationIndex()
+    assert lot_ids(index.near_pin_code('560001')) == [exact.id, same_five.id, near_digit.id, far_digit.id, other_city.id]
+    assert lot_ids(index.near_pin_code('560001', min_shared_digits=3)) == [exact.id, same_five.id, near_digit.id, far_digit.id]
+    assert lot_ids(index.near_pin_code('110005', min_shared_digits=3)) == [other_city.id]
+    assert lot_ids(index.near_pin_code('999999', min_shared_digits=1)) == []
+
+
+def test_missing_pin_branch_still_ranks_by_digit_closeness(app):
+    low = make_lot('Low', '560010')
+    middle = make_lot('Middle', '560040')
+    high = make_lot('High', '560090')
+    elsewhere = make_lot('Elsewhere', '561000')
+
+    # No lot starts with 56005, so the walk stops at 5600 and ranks its branches around the 5
+    index = LotLocationIndex()
+    assert lot_ids(index.near_pin_code('560055')) == [middle.id, low.id, high.id, elsewhere.id]
+    assert lot_ids(index.near_pin_code('560085', min_shared_digits=4)) == [high.id, middle.id, low.id]
+
+
+def test_ring_search_orders_by_distance_within_radius(app):
+    here = make_lot('Here', lot_id=1)
+    one_km = make_lot('1 km', lot_id=2)
+    twenty_km = make_lot('20 km', lot_id=3)
+    across_cells = make_lot('Next cell', lot_id=4)
+    far_away = make_lot('Delhi', lot_id=5)
+    place(here, 12.9716, 77.5946)
+    place(one_km, 12.9806, 77.5946)
+    place(twenty_km, 13.1516, 77.5946)
+    place(across_cells, 12.9716, 77.6046) # About 1.1 km east, in a different grid cell
+    place(far_away, 28.6139, 77.2090)
+
+    results = list(LotLocationIndex().near_coordinates(12.9716, 77.5946, max_km=25))
+    assert lot_ids(results) == [here.id, one_km.id, across_cells.id, twenty_km.id]
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    assert abs(distances[1] - 1.0) < 0.05
+    assert lot_ids(LotLocationIndex().near_coordinates(12.9716, 77.5946, max_km=5)) == [here.id, one_km.id, across_cells.id]
+
+
+def test_point_search_skips_far_lots_with_coordinates_in_pin_matches(app):
+    with_point = make_lot('Mapped', '560002')
+    without_point = make_lot('Unmapped', '560001')
+    far_same_district = make_lot('Mapped but far', '560003')
+    place(with_point, 12.9716, 77.5946)
+    place(far_same_district, 13.5, 77.5946)
+
+    results = LotLocationIndex().near('560001', 12.97, 77.59, max_km=10, min_shared_digits=3)
+    assert lot_ids(results) == [with_point.id, without_point.id]
+
+
+def test_nearest_endpoint_returns_lots_with_free_spots(client):
+    full = make_lot('Full', '560001', spots=2, occupied={1, 2})
+    free = make_lot('Free', '560002', spots=3, occupied={1})
+    make_lot('Delhi', '110001')
+
+    response = client.get('/api/lots/nearest?pin_code=560001')
+    assert response.status_code == 200
+    lots = response.get_json()['parking_lots']
+    assert [lot['id'] for lot in lots] == [free.id]
+    assert lots[0]['available_spots'] == 2
+    assert full.id not in [lot['id'] for lot in lots]
+
+
+def test_nearest_endpoint_rejects_bad_coordinates(client):
+    make_lot()
+    for query in ('lat=nan&lon=77', 'lat=inf&lon=77', 'lat=1e308&lon=77', 'lat=179.9&lon=77',
+                  'lat=12&lon=181', 'lat=12', 'pin_code=5600', ''):
+        assert client.get(f'/api/lots/nearest?{query}').status_code == 400, query
+
+
+class CountingGrid(dict):
+    lookups = 0
+
+    def get(self, *args):
+        CountingGrid.lookups += 1
+        return super().get(*args)
+
+
+def test_point_outside_indexed_area_visits_no_cells(app, monkeypatch):
+    for i in range(30):
+        place(make_lot(f'Lot {i}', lot_id=i + 1), 12.0 + i * 0.5, 77.0 + i * 0.5)
+    index = LotLocationIndex()
+    snapshot = index._load()
+    snapshot['grid'] = CountingGrid(snapshot['grid'])
+    CountingGrid.lookups = 0
+    distances = []
+    monkeypatch.setattr(LotLocationIndex, 'distance_km', classmethod(lambda cls, *args: distances.append(args) or 0.0))
+
+    assert list(index.near_coordinates(-89, -179, max_km=25)) == []
+    assert CountingGrid.lookups == 0
+    assert distances == []
+
+
+def test_index_picks_up_changes_from_other_processes(app):
+    index = LotLocationIndex()
+    index.STALENESS_CHECK_SECONDS = 0
+    first = make_lot('First', '560001')
+    assert lot_ids(index.near_pin_code('560001', 6)) == [first.id]
+
+    # Written straight to the database, as another worker would, without calling refresh()
+    second = make_lot('Second', '560001')
+    assert lot_ids(index.near_pin_code('560001', 6)) == [first.id, second.id]
+
+    ParkingLot.query.filter_by(id=first.id).update({'pin_code': '560002'})
+    db.session.commit()
+    assert lot_ids(index.near_pin_code('560001', 6)) == [second.id]
+
+    place(second, 12.97, 77.59)
+    assert lot_ids(index.near_coordinates(12.97, 77.59, max_km=1)) == [second.id]
+    LotLocation.query.filter_by(lot_id=second.id).update({'latitude': 13.5})
+    db.session.commit()
+    assert lot_ids(index.near_coordinates(12.97, 77.59, max_km=1)) == []
+
+
+def test_index_is_not_rechecked_within_interval(app):
+    index = LotLocationIndex()
+    first = make_lot('First', '560001')
+    assert lot_ids(index.near_pin_code('560001', 6)) == [first.id]
+    make_lot('Second', '560001')
+    assert lot_ids(index.near_pin_code('560001', 6)) == [first.id]
+    index.refresh()
+    assert len(lot_ids(index.near_pin_code('560001', 6))) == 2
+
+
+def test_claim_spot_only_takes_available_spots(app):
+    lot = make_lot(spots=3, occupied={1})
+    first = claim_spot(lot.id)
+    second = claim_spot(lot.id)
+    db.session.commit()
+    assert (first.spot_number, second.spot_number) == (2, 3)
+    assert claim_spot(lot.id) is None
+    assert ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count() == 3
+
+
+def test_claim_spot_skips_a_spot_taken_meanwhile(app):
+    lot = make_lot(spots=2)
+    raced = []
+
+    def take_spot_one_first(conn, cursor, statement, parameters, context, executemany):
+        # Another booking occupies spot 1 between claim_spot's lookup and its conditional update
+        if statement.startswith('UPDATE parking_spot') and not raced:
+            raced.append(True)
+            with db.engine.connect() as other:
+                other.execute(ParkingSpot.__table__.update().where(ParkingSpot.spot_number == 1).values(status='O'))
+                other.commit()
+
+    event.listen(db.engine, 'before_cursor_execute', take_spot_one_first)
+    try:
+        spot = claim_spot(lot.id)
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', take_spot_one_first)
+    assert raced
+    assert spot.spot_number == 2
+    assert ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count() == 2
+
+
+def test_spillover_books_nearest_lot(client):
+    full = make_lot('Koramangala', '560034', spots=1, occupied={1})
+    near = make_lot('HSR Layout', '560102', spots=1)
+    nearer = make_lot('Ejipura', '560047', spots=1)
+    place(full, 12.9352, 77.6245)
+    place(near, 12.9116, 77.6474)
+    place(nearer, 12.9406, 77.6270)
+    parking_app.lot_locations.refresh()
+    user = make_user()
+    log_in(client, user)
+
+    client.get(f'/book_spot/{full.id}?spillover=1')
+    reservation = ReservedSpot.query.filter_by(user_id=user.id).one()
+    assert reservation.spot.lot_id == nearer.id
+
+
+def test_spillover_never_leaves_the_city(client):
+    bangalore = make_lot('Bangalore', '560001', spots=1, occupied={1})
+    delhi = make_lot('Delhi', '110001', spots=1)
+    place(delhi, 28.6139, 77.2090)
+    unmapped_delhi = make_lot('Delhi unmapped', '110002', spots=1)
+    user = make_user()
+    log_in(client, user)
+
+    client.get(f'/book_spot/{bangalore.id}?spillover=1')
+    with client.session_transaction() as session:
+        assert ('danger', 'No available spots in this parking lot or any nearby lot.') in session['_flashes']
+    assert ReservedSpot.query.count() == 0
+    assert ParkingSpot.query.filter_by(lot_id=unmapped_delhi.id, status='A').count() == 1
+
+
+def test_price_edit_keeps_index(client, monkeypatch):
+    lot = make_lot('Lot', '560001')
+    admin = make_user('boss')
+    admin.role = 'admin'
+    db.session.commit()
+    log_in(client, admin)
+    refreshes = []
+    monkeypatch.setattr(parking_app.lot_locations, 'refresh', lambda: refreshes.append(True))
+    form = {'prime_location_name': 'Lot', 'price_per_hour': '20', 'address': '1 Main Road',
+            'pin_code': '560001', 'maximum_number_of_spots': '5', 'latitude': '', 'longitude': ''}
+
+    client.post(f'/edit_parking_lot/{lot.id}', data=form)
+    assert refreshes == []
+    client.post(f'/edit_parking_lot/{lot.id}', data=dict(form, latitude='12.97', longitude='77.59'))
+    assert refreshes == [True]